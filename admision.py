@@ -0,0 +1,178 @@
+import os
+import threading
+import time
+from functools import wraps
+from flask import Response, request
+from serializacion import respuesta_json
+from database import REPLICA_URLS, REPLICA_MAX_LAG, REPLICA_CHECK_INTERVAL, COOKIE_ULTIMA_ESCRITURA
+
+# Cupos para reportes, aparte de los hilos que atienden ventas
+REPORTES_CONCURRENCIA = int(os.getenv('REPORTES_CONCURRENCIA', 2))
+# Reportes que pueden esperar cupo antes de responder 429
+REPORTES_COLA = int(os.getenv('REPORTES_COLA', 4))
+# Segundos de espera por un cupo antes de responder 503
+REPORTES_ESPERA = float(os.getenv('REPORTES_ESPERA', 2))
+# Requests que pueden esperar el resultado de un reporte identico en curso
+REPORTES_SEGUIDORES = int(os.getenv('REPORTES_SEGUIDORES', 3))
+# Segundos que esperan ese resultado; por debajo del --timeout 120 de gunicorn
+REPORTES_ESPERA_RESULTADO = float(os.getenv('REPORTES_ESPERA_RESULTADO', 100))
+REPORTES_CACHE_TTL = float(os.getenv('REPORTES_CACHE_TTL', 60))
+REPORTES_CACHE_MAX = int(os.getenv('REPORTES_CACHE_MAX', 128))
+
+# La clave de cache es (endpoint, periodo, fecha_inicio, fecha_fin, tipo)
+PARAMETROS_CLAVE = ('periodo', 'fecha_inicio', 'fecha_fin', 'tipo')
+
+_cupos = threading.BoundedSemaphore(REPORTES_CONCURRENCIA)
+_lock = threading.Lock()
+_esperando = 0    # requests esperando cupo; limitado por REPORTES_COLA
+_siguiendo = 0    # requests esperando el resultado de otro; limitado por REPORTES_SEGUIDORES
+_cache = {}       # clave -> (expira, cuerpo)
+_en_curso = {}    # clave -> {'evento', 'rechazo'} del request que lo esta calculando
+_generacion = 0   # cambia con cada invalidacion; descarta resultados calculados antes
+_ultima_invalidacion = None  # time.monotonic() de la ultima invalidacion
+
+# Tras una invalidacion una replica puede seguir sin la escritura durante este
+# tiempo (retraso tolerado mas el intervalo de revision): lo calculado ahi no se cachea
+VENTANA_REPLICA = REPLICA_MAX_LAG + REPLICA_CHECK_INTERVAL if REPLICA_URLS else 0
+
+RECHAZO_COLA = (429, 'Demasiados reportes en espera, intenta de nuevo en unos segundos')
+RECHAZO_OCUPADO = (503, 'Servidor ocupado generando reportes, intenta de nuevo en unos segundos')
+
+
+def _rechazar(estado, mensaje):
+    return respuesta_json({'error': mensaje}), estado, {'Retry-After': str(int(REPORTES_ESPERA) or 1)}
+
+
+def _entrar_a_la_cola():
+    """Reserva un lugar de espera; False si la cola esta llena"""
+    global _esperando
+    with _lock:
+        if _esperando >= REPORTES_COLA:
+            return False
+        _esperando += 1
+        return True
+
+
+def _salir_de_la_cola():
+    global _esperando
+    with _lock:
+        _esperando -= 1
+
+
+def _empezar_a_seguir():
+    """Reserva un lugar para esperar un calculo identico; False si ya hay demasiados"""
+    global _siguiendo
+    with _lock:
+        if _siguiendo >= REPORTES_SEGUIDORES:
+            return False
+        _siguiendo += 1
+        return True
+
+
+def _dejar_de_seguir():
+    global _siguiendo
+    with _lock:
+        _siguiendo -= 1
+
+
+def _ejecutar(f, args, kwargs):
+    """Corre el reporte dentro de un cupo. Devuelve (respuesta, rechazo); rechazo es None si corrio"""
+    if not _entrar_a_la_cola():
+        return _rechazar(*RECHAZO_COLA), RECHAZO_COLA
+    try:
+        obtenido = _cupos.acquire(timeout=REPORTES_ESPERA)
+    finally:
+        _salir_de_la_cola()
+    if not obtenido:
+        return _rechazar(*RECHAZO_OCUPADO), RECHAZO_OCUPADO
+    try:
+        return f(*args, **kwargs), None
+    finally:
+        _cupos.release()
+
+
+def _en_ventana_replica():
+    """True si una replica aun puede no tener la ultima invalidacion (llamar con _lock)"""
+    return (_ultima_invalidacion is not None
+            and time.monotonic() - _ultima_invalidacion < VENTANA_REPLICA)
+
+
+def reporte_controlado(f):
+    """Limita la concurrencia del endpoint de reporte y cachea su respuesta.
+
+    Requests identicos simultaneos comparten un solo calculo. Como un reporte
+    lento puede tardar mas que REPORTES_ESPERA, los que esperan ese calculo
+    tienen su propio limite (REPORTES_SEGUIDORES) y esperan hasta
+    REPORTES_ESPERA_RESULTADO; el limite evita que acaparen los hilos que
+    atienden ventas.
+
+    Los requests con la cookie de ultima escritura leen de la primaria: no
+    usan ni llenan la cache, que puede venir de una replica.
+    """
+    @wraps(f)
+    def envoltura(*args, **kwargs):
+        if request.cookies.get(COOKIE_ULTIMA_ESCRITURA):
+            return _ejecutar(f, args, kwargs)[0]
+        clave = (request.endpoint,) + tuple(request.args.get(p) for p in PARAMETROS_CLAVE)
+        while True:
+            with _lock:
+                entrada = _cache.get(clave)
+                if entrada and entrada[0] > time.monotonic():
+                    return Response(entrada[1], mimetype='application/json'), 200
+                calculo = _en_curso.get(clave)
+                if calculo is None:
+                    calculo = _en_curso[clave] = {'evento': threading.Event(), 'rechazo': None}
+                    generacion = _generacion
+                    break
+            if not _empezar_a_seguir():
+                return _rechazar(*RECHAZO_COLA)
+            try:
+                terminado = calculo['evento'].wait(REPORTES_ESPERA_RESULTADO)
+            finally:
+                _dejar_de_seguir()
+            if not terminado:
+                return _rechazar(*RECHAZO_OCUPADO)
+            if calculo['rechazo']:
+                # El calculo que se esperaba fue rechazado: el mismo rechazo para todos
+                return _rechazar(*calculo['rechazo'])
+            # Si el otro request no dejo resultado en cache, este pasa a calcularlo
+
+        try:
+            respuesta, calculo['rechazo'] = _ejecutar(f, args, kwargs)
+            cuerpo, estado = respuesta[0], respuesta[1]
+            encabezados = respuesta[2] if len(respuesta) > 2 else {}
+            # Las respuestas de error marcadas con no-store no se cachean aunque sean 200
+            if estado == 200 and encabezados.get('Cache-Control') != 'no-store':
+                with _lock:
+                    if generacion == _generacion and not _en_ventana_replica():
+                        if len(_cache) >= REPORTES_CACHE_MAX:
+                            del _cache[next(iter(_cache))]
+                        _cache[clave] = (time.monotonic() + REPORTES_CACHE_TTL, cuerpo.get_data())
+            return respuesta
+        finally:
+            with _lock:
+                _en_curso.pop(clave, None)
+            calculo['evento'].set()
+    return envoltura
+
+
+def invalidar_reportes(fecha=None):
+    """Descarta los reportes cacheados cuyo rango incluye la fecha (todos si fecha es None).
+
+    Se llama despues de confirmar una escritura, asi que nunca lanza: si la fecha
+    no se puede comparar se descarta toda la cache.
+    """
+    global _generacion, _ultima_invalidacion
+    with _lock:
+        _generacion += 1
+        _ultima_invalidacion = time.monotonic()
+        try:
+            fecha = None if fecha is None else str(fecha)
+            for clave in list(_cache):
+                fecha_inicio, fecha_fin = clave[2], clave[3]
+                # Sin rango explicito el reporte cubre el periodo actual
+                if fecha is None or not fecha_inicio or not fecha_fin or fecha_inicio <= fecha <= fecha_fin:
+                    del _cache[clave]
+        except Exception as e:
+            print(f"Error invalidar_reportes: {e}")
+            _cache.clear()
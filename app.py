@@ -1,5 +1,6 @@
 import os
-from flask import Flask, jsonify, send_from_directory
+import time
+from flask import Flask, jsonify, request, send_from_directory
 from flask_cors import CORS
 from dotenv import load_dotenv
 from werkzeug.middleware.proxy_fix import ProxyFix
@@ -13,9 +14,18 @@ CORS(app)
 
 from routes.productos import productos_bp
 from routes.ventas import ventas_bp
+from database import COOKIE_ULTIMA_ESCRITURA, REPLICA_URLS, REPLICA_MAX_LAG, REPLICA_CHECK_INTERVAL
 app.register_blueprint(productos_bp, url_prefix='/productos')
 app.register_blueprint(ventas_bp, url_prefix='/ventas')
 
+@app.after_request
+def marcar_escritura(response):
+    # Las lecturas siguientes de este cliente van a la primaria (ver replica_para_ruta)
+    if REPLICA_URLS and request.method in ('POST', 'PUT', 'DELETE') and response.status_code < 400:
+        response.set_cookie(COOKIE_ULTIMA_ESCRITURA, str(time.time()),
+                            max_age=int(REPLICA_MAX_LAG + REPLICA_CHECK_INTERVAL) + 1, samesite='Lax')
+    return response
+
 @app.route('/')
 def index():
     return send_from_directory('.', 'index.html')
@@ -29,9 +39,10 @@ def health():
     return jsonify({'status': 'ok'})
 
 try:
-    from database import test_connection, init_database
+    from database import test_connection, init_database, iniciar_mantenimiento_particiones
     test_connection()
     init_database()
+    iniciar_mantenimiento_particiones()
     print("Base de datos lista")
 except Exception as e:
     print(f"Error BD: {e}")
@@ -0,0 +1,302 @@
+#!/usr/bin/env python
+"""
+Archivo de periodos cerrados de Ventas, DetalleVentas y MovimientosInventario.
+
+Cada mes archivado se guarda como una base SQLite comprimida
+(archivo/ventas_AAAA-MM.db.gz) que los reportes abren bajo demanda.
+
+Uso: python archivo.py [meses_a_conservar]
+"""
+import gzip
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date
+from database import (DATABASE_URL, get_db_connection, execute_query, execute_transaction,
+                      sumar_meses, nombre_particion, asegurar_particiones)
+from serializacion import preparar
+
+# Con PostgreSQL el archivo es la unica copia de los meses archivados: debe
+# configurarse explicitamente en almacenamiento persistente (ver archivar())
+ARCHIVO_DIR_CONFIGURADO = os.getenv('ARCHIVO_DIR')
+ARCHIVO_DIR = ARCHIVO_DIR_CONFIGURADO or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'archivo')
+ARCHIVO_CACHE_DIR = os.getenv('ARCHIVO_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'entrelazarte_archivo'))
+# Meses descomprimidos que se conservan en la cache; se descartan los menos usados
+ARCHIVO_CACHE_MAX = int(os.getenv('ARCHIVO_CACHE_MAX', 12))
+RETENCION_MESES = int(os.getenv('RETENCION_MESES', 12))
+
+COLUMNAS = {
+    'Ventas': ('VentaID', 'Fecha', 'Total', 'Recibido', 'Cambio', 'Descripcion'),
+    'DetalleVentas': ('DetalleID', 'VentaID', 'Fecha', 'ProductoID', 'NombreProducto',
+                      'Cantidad', 'PrecioUnitario', 'Subtotal'),
+    'MovimientosInventario': ('MovimientoID', 'ProductoID', 'Tipo', 'Cantidad', 'Fecha'),
+    # Copia de los nombres para que los reportes funcionen sin la base principal
+    'Productos': ('ProductoID', 'Nombre'),
+}
+
+ESQUEMA_ARCHIVO = [
+    """CREATE TABLE IF NOT EXISTS Ventas (
+        VentaID INTEGER PRIMARY KEY, Fecha DATETIME NOT NULL,
+        Total DECIMAL(10,2) NOT NULL, Recibido DECIMAL(10,2) NOT NULL,
+        Cambio DECIMAL(10,2) NOT NULL, Descripcion TEXT)""",
+    """CREATE TABLE IF NOT EXISTS DetalleVentas (
+        DetalleID INTEGER PRIMARY KEY, VentaID INTEGER NOT NULL, Fecha DATETIME,
+        ProductoID INTEGER NOT NULL, NombreProducto VARCHAR(100) NOT NULL,
+        Cantidad INTEGER NOT NULL, PrecioUnitario DECIMAL(10,2) NOT NULL,
+        Subtotal DECIMAL(10,2) NOT NULL)""",
+    """CREATE TABLE IF NOT EXISTS MovimientosInventario (
+        MovimientoID INTEGER PRIMARY KEY, ProductoID INTEGER,
+        Tipo TEXT, Cantidad INTEGER, Fecha DATETIME)""",
+    """CREATE TABLE IF NOT EXISTS Productos (
+        ProductoID INTEGER PRIMARY KEY, Nombre VARCHAR(100))""",
+]
+
+
+def _a_fecha(valor):
+    """Convierte 'AAAA-MM-DD...' o date/datetime a date"""
+    if isinstance(valor, date):
+        return date(valor.year, valor.month, valor.day)
+    return date.fromisoformat(str(valor)[:10])
+
+
+def _ruta_archivo(periodo):
+    return os.path.join(ARCHIVO_DIR, f"ventas_{periodo.year}-{periodo.month:02d}.db.gz")
+
+
+def _ruta_pendiente(periodo):
+    """Archivo ya escrito cuyas filas quizas siguen en las tablas principales; los reportes no lo leen"""
+    return _ruta_archivo(periodo) + '.pendiente'
+
+
+def periodos_archivados():
+    """Meses (primer dia) que ya tienen archivo comprimido"""
+    if not os.path.isdir(ARCHIVO_DIR):
+        return []
+    periodos = []
+    for nombre in os.listdir(ARCHIVO_DIR):
+        if nombre.startswith('ventas_') and nombre.endswith('.db.gz'):
+            periodos.append(date.fromisoformat(nombre[len('ventas_'):-len('.db.gz')] + '-01'))
+    return sorted(periodos)
+
+
+def _extremo(valor):
+    """Extremo de un rango de reporte; None (abierto) si falta o no es una fecha.
+
+    Los parametros llegan tal cual del navegador (ej. ' 00:00:00' si se borro la
+    fecha) y la consulta principal los compara como texto sin fallar.
+    """
+    if not valor:
+        return None
+    try:
+        return _a_fecha(valor)
+    except ValueError:
+        return None
+
+
+def periodos_en_rango(fecha_inicio=None, fecha_fin=None):
+    """Meses archivados que se solapan con [fecha_inicio, fecha_fin]; None deja el extremo abierto"""
+    inicio = _extremo(fecha_inicio)
+    fin = _extremo(fecha_fin)
+    return [p for p in periodos_archivados()
+            if (fin is None or p <= fin) and (inicio is None or sumar_meses(p, 1) > inicio)]
+
+
+def _podar_cache(conservar):
+    """Borra los meses descomprimidos menos usados hasta dejar ARCHIVO_CACHE_MAX"""
+    usados = []
+    for nombre in os.listdir(ARCHIVO_CACHE_DIR):
+        ruta = os.path.join(ARCHIVO_CACHE_DIR, nombre)
+        if nombre.endswith('.db') and ruta != conservar:
+            try:
+                usados.append((os.path.getatime(ruta), ruta))
+            except OSError:
+                pass
+    for _, ruta in sorted(usados)[:max(len(usados) + 1 - ARCHIVO_CACHE_MAX, 0)]:
+        try:
+            # En Linux una conexion abierta sigue leyendo el archivo ya borrado
+            os.remove(ruta)
+        except OSError:
+            pass
+
+
+def _abrir(periodo):
+    """Descomprime el mes a la cache (solo si cambio) y lo abre en modo lectura"""
+    origen = _ruta_archivo(periodo)
+    os.makedirs(ARCHIVO_CACHE_DIR, exist_ok=True)
+    cache = os.path.join(ARCHIVO_CACHE_DIR, os.path.basename(origen)[:-len('.gz')])
+    try:
+        vigente = os.path.getmtime(cache) >= os.path.getmtime(origen)
+        if vigente:
+            # El acceso marca el uso sin tocar el mtime, que indica si la copia esta al dia
+            os.utime(cache, (time.time(), os.path.getmtime(cache)))
+    except FileNotFoundError:
+        # Nunca descomprimido, o descartado por _podar_cache de otro hilo
+        vigente = False
+    if not vigente:
+        # Un temporal unico por llamada: varios hilos pueden abrir el mismo mes a la vez
+        fd, temporal = tempfile.mkstemp(suffix='.tmp', dir=ARCHIVO_CACHE_DIR)
+        try:
+            with gzip.open(origen, 'rb') as entrada, os.fdopen(fd, 'wb') as salida:
+                shutil.copyfileobj(entrada, salida)
+            os.replace(temporal, cache)
+        except BaseException:
+            os.remove(temporal)
+            raise
+        _podar_cache(cache)
+    conn = sqlite3.connect(f"file:{cache}?mode=ro", uri=True)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def consultar_archivo(query, params=None, fecha_inicio=None, fecha_fin=None):
+    """Ejecuta la consulta en cada mes archivado del rango y concatena las filas.
+
+    Las bases de archivo usan el mismo esquema que la principal, asi que las
+    consultas de reportes se reutilizan sin cambios.
+    """
+    filas = []
+    for periodo in periodos_en_rango(fecha_inicio, fecha_fin):
+        conn = _abrir(periodo)
+        try:
+            cursor = conn.execute(query, params) if params else conn.execute(query)
+            filas.extend(dict(row) for row in cursor.fetchall())
+        finally:
+            conn.close()
+    return filas
+
+
+def _escribir_archivo(periodo, tablas):
+    """Agrega las filas al archivo del mes y deja el resultado comprimido como pendiente"""
+    os.makedirs(ARCHIVO_DIR, exist_ok=True)
+    destino = _ruta_pendiente(periodo)
+    # Un pendiente de una corrida interrumpida ya incluye todo lo publicado
+    base = destino if os.path.exists(destino) else _ruta_archivo(periodo)
+    fd, temporal = tempfile.mkstemp(suffix='.db', dir=ARCHIVO_DIR)
+    os.close(fd)
+    try:
+        if os.path.exists(base):
+            with gzip.open(base, 'rb') as entrada, open(temporal, 'wb') as salida:
+                shutil.copyfileobj(entrada, salida)
+        conn = sqlite3.connect(temporal)
+        try:
+            for ddl in ESQUEMA_ARCHIVO:
+                conn.execute(ddl)
+            for tabla, filas in tablas.items():
+                columnas = COLUMNAS[tabla]
+                conn.executemany(
+                    f"INSERT OR REPLACE INTO {tabla} ({', '.join(columnas)}) VALUES ({', '.join(['?'] * len(columnas))})",
+                    [tuple(fila.get(c) for c in columnas) for fila in preparar(filas)])
+            conn.commit()
+        finally:
+            conn.close()
+        with open(temporal, 'rb') as entrada, gzip.open(destino + '.tmp', 'wb') as salida:
+            shutil.copyfileobj(entrada, salida)
+        os.replace(destino + '.tmp', destino)
+    finally:
+        os.remove(temporal)
+
+
+def _borrar_periodo(inicio, fin):
+    """Quita el mes de las tablas principales; en PostgreSQL suelta la particion si existe"""
+    rango = (inicio.isoformat(), fin.isoformat())
+    borrados = {
+        'DetalleVentas': "DELETE FROM DetalleVentas WHERE VentaID IN (SELECT VentaID FROM Ventas WHERE Fecha >= ? AND Fecha < ?)",
+        'Ventas': "DELETE FROM Ventas WHERE Fecha >= ? AND Fecha < ?",
+        'MovimientosInventario': "DELETE FROM MovimientosInventario WHERE Fecha >= ? AND Fecha < ?",
+    }
+    if not DATABASE_URL:
+        execute_transaction([(query, rango) for query in borrados.values()])
+        return
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        # DetalleVentas primero: su FK apunta a Ventas
+        for tabla, query in borrados.items():
+            particion = nombre_particion(tabla, inicio)
+            cursor.execute("SELECT COUNT(*) as count FROM pg_class WHERE relname = %s", (particion,))
+            if cursor.fetchone()['count']:
+                cursor.execute(f"ALTER TABLE {tabla} DETACH PARTITION {particion}")
+                cursor.execute(f"DROP TABLE {particion}")
+            else:
+                cursor.execute(query.replace('?', '%s'), rango)
+
+
+def archivar_periodo(periodo):
+    """Mueve un mes cerrado al archivo comprimido. Devuelve la cantidad de ventas archivadas."""
+    inicio = sumar_meses(periodo, 0)
+    fin = sumar_meses(periodo, 1)
+    rango = (inicio.isoformat(), fin.isoformat())
+    ventas = execute_query(
+        "SELECT VentaID, Fecha, Total, Recibido, Cambio, Descripcion FROM Ventas WHERE Fecha >= ? AND Fecha < ?", rango)
+    detalles = execute_query("""SELECT dv.DetalleID, dv.VentaID, v.Fecha, dv.ProductoID, dv.NombreProducto,
+            dv.Cantidad, dv.PrecioUnitario, dv.Subtotal
+        FROM DetalleVentas dv JOIN Ventas v ON dv.VentaID = v.VentaID
+        WHERE v.Fecha >= ? AND v.Fecha < ?""", rango)
+    movimientos = execute_query(
+        "SELECT MovimientoID, ProductoID, Tipo, Cantidad, Fecha FROM MovimientosInventario WHERE Fecha >= ? AND Fecha < ?", rango)
+    if not ventas and not movimientos:
+        if os.path.exists(_ruta_pendiente(inicio)):
+            # Una corrida anterior se corto despues de borrar: solo falta publicar el archivo
+            os.replace(_ruta_pendiente(inicio), _ruta_archivo(inicio))
+        return 0
+    productos = execute_query("SELECT ProductoID, Nombre FROM Productos")
+    # Primero se escribe el pendiente, despues se borra y recien entonces se
+    # publica: los reportes nunca ven el mes en el archivo y en las tablas a la vez.
+    # Si algo falla a mitad, volver a correr el comando lo completa sin perder datos
+    _escribir_archivo(inicio, {
+        'Ventas': ventas,
+        'DetalleVentas': detalles,
+        'MovimientosInventario': movimientos,
+        'Productos': productos,
+    })
+    _borrar_periodo(inicio, fin)
+    os.replace(_ruta_pendiente(inicio), _ruta_archivo(inicio))
+    return len(ventas)
+
+
+def archivar(retencion=RETENCION_MESES):
+    """Archiva todos los meses anteriores a los ultimos 'retencion' meses"""
+    if DATABASE_URL and not ARCHIVO_DIR_CONFIGURADO:
+        # La carpeta por defecto esta junto al codigo: en Railway se pierde en cada deploy
+        raise RuntimeError("Con PostgreSQL hay que definir ARCHIVO_DIR en un volumen persistente antes de archivar")
+    limite = sumar_meses(date.today(), -retencion)
+    minimos = execute_query("""SELECT MIN(Fecha) as fecha FROM Ventas
+        UNION ALL SELECT MIN(Fecha) as fecha FROM MovimientosInventario""")
+    fechas = [_a_fecha(row['fecha']) for row in minimos if row['fecha']]
+    archivados = 0
+    # Completar primero los meses que quedaron pendientes en una corrida anterior
+    if os.path.isdir(ARCHIVO_DIR):
+        for nombre in sorted(os.listdir(ARCHIVO_DIR)):
+            if nombre.startswith('ventas_') and nombre.endswith('.db.gz.pendiente'):
+                archivados += archivar_periodo(date.fromisoformat(nombre[len('ventas_'):-len('.db.gz.pendiente')] + '-01'))
+    if fechas:
+        periodo = sumar_meses(min(fechas), 0)
+        while periodo < limite:
+            cantidad = archivar_periodo(periodo)
+            if cantidad:
+                print(f"Periodo {periodo.year}-{periodo.month:02d} archivado: {cantidad} ventas")
+            archivados += cantidad
+            periodo = sumar_meses(periodo, 1)
+    if DATABASE_URL:
+        asegurar_particiones()
+    elif archivados:
+        # Recupera el espacio de las filas movidas para que el archivo y sus respaldos no crezcan
+        execute_query("VACUUM", fetch=False)
+    return archivados
+
+
+def main():
+    retencion = int(sys.argv[1]) if len(sys.argv) > 1 else RETENCION_MESES
+    print(f"Archivando periodos anteriores a los ultimos {retencion} meses en {ARCHIVO_DIR}")
+    try:
+        total = archivar(retencion)
+    except RuntimeError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    print(f"Listo: {total} ventas archivadas")
+
+
+if __name__ == "__main__":
+    main()
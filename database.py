@@ -1,7 +1,19 @@
 import os
+import threading
+import time
 from contextlib import contextmanager
+from datetime import date
+from itertools import count
 
 DATABASE_URL = os.getenv('DATABASE_URL')
+# Réplicas de solo lectura (separadas por coma) para reportes y listados
+REPLICA_URLS = [u.strip() for u in os.getenv('DATABASE_REPLICA_URLS', '').split(',') if u.strip()]
+REPLICA_MAX_LAG = float(os.getenv('DATABASE_REPLICA_MAX_LAG', 10))
+REPLICA_CHECK_INTERVAL = float(os.getenv('DATABASE_REPLICA_CHECK_INTERVAL', 5))
+# Endpoints (ej. 'ventas.estadisticas') que siempre leen de la primaria
+RUTAS_SOLO_PRIMARIA = {r.strip() for r in os.getenv('DATABASE_PRIMARY_ROUTES', '').split(',') if r.strip()}
+# Cookie con la hora (epoch) de la última escritura del cliente; ver app.py
+COOKIE_ULTIMA_ESCRITURA = 'ultima_escritura'
 
 def normalize_keys(row):
     """Convierte claves de minúsculas a su forma original con mayúsculas correctas"""
@@ -53,10 +65,21 @@ if DATABASE_URL:
     from psycopg2.extras import RealDictCursor
     if DATABASE_URL.startswith("postgres://"):
         DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
+    REPLICA_URLS = [u.replace("postgres://", "postgresql://", 1) if u.startswith("postgres://") else u for u in REPLICA_URLS]
+
+    _estado_replicas = {}   # url -> True si está sana; lo actualiza el hilo de _vigilar_replicas
+    _turno_replica = count()
+    _vigilancia = None
+    _vigilancia_lock = threading.Lock()
 
     @contextmanager
-    def get_db_connection():
-        conn = psycopg2.connect(DATABASE_URL, cursor_factory=RealDictCursor)
+    def get_db_connection(url=None, solo_lectura=False):
+        if url:
+            conn = psycopg2.connect(url, cursor_factory=RealDictCursor, connect_timeout=3)
+        else:
+            conn = psycopg2.connect(DATABASE_URL, cursor_factory=RealDictCursor)
+        if solo_lectura:
+            conn.set_session(readonly=True)
         try:
             yield conn
             conn.commit()
@@ -66,8 +89,66 @@ if DATABASE_URL:
         finally:
             conn.close()
 
-    def execute_query(query, params=None, fetch=True):
+    def _replica_sana(url):
+        """Una réplica es elegible si responde, recibe WAL en streaming y su retraso no supera REPLICA_MAX_LAG segundos"""
+        try:
+            with get_db_connection(url, solo_lectura=True) as conn:
+                cursor = conn.cursor()
+                # Con el receptor de WAL caído receive_lsn deja de avanzar y queda igual
+                # a replay_lsn: sin exigir 'streaming' eso se leería como retraso 0.
+                # El status solo es visible para roles con pg_read_all_stats.
+                cursor.execute("""SELECT pg_is_in_recovery() AS en_recuperacion,
+                        EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming') AS recibiendo,
+                        CASE
+                            WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                            ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+                        END AS lag""")
+                estado = cursor.fetchone()
+            if not estado['en_recuperacion']:
+                return True
+            if not estado['recibiendo']:
+                print("Replica sin receptor de WAL en streaming, se usa la primaria")
+                return False
+            lag = float(estado['lag'])
+            if lag > REPLICA_MAX_LAG:
+                print(f"Replica con retraso de {lag:.1f}s, se usa la primaria")
+                return False
+            return True
+        except Exception as e:
+            print(f"Replica no disponible: {e}")
+            return False
+
+    def _vigilar_replicas():
+        """Revisa las réplicas cada REPLICA_CHECK_INTERVAL fuera de los requests"""
+        while True:
+            for url in REPLICA_URLS:
+                _estado_replicas[url] = _replica_sana(url)
+            time.sleep(REPLICA_CHECK_INTERVAL)
+
+    def _elegir_replica():
+        """Turno rotativo entre réplicas sanas; no hace consultas, solo lee el último estado"""
+        global _vigilancia
+        if _vigilancia is None:
+            with _vigilancia_lock:
+                if _vigilancia is None:
+                    _vigilancia = threading.Thread(target=_vigilar_replicas, name='vigilancia-replicas', daemon=True)
+                    _vigilancia.start()
+        candidatas = [url for url in REPLICA_URLS if _estado_replicas.get(url)]
+        if not candidatas:
+            return None
+        return candidatas[next(_turno_replica) % len(candidatas)]
+
+    def execute_query(query, params=None, fetch=True, replica=None):
         query = query.replace('?', '%s')
+        if fetch and replica:
+            try:
+                with get_db_connection(replica, solo_lectura=True) as conn:
+                    cursor = conn.cursor()
+                    cursor.execute(query, params) if params else cursor.execute(query)
+                    return [normalize_keys(dict(row)) for row in cursor.fetchall()]
+            except psycopg2.OperationalError as e:
+                print(f"Error en replica, reintentando en la primaria: {e}")
+                _estado_replicas[replica] = False
         with get_db_connection() as conn:
             cursor = conn.cursor()
             if fetch:
@@ -122,7 +203,8 @@ else:
         finally:
             conn.close()
 
-    def execute_query(query, params=None, fetch=True):
+    def execute_query(query, params=None, fetch=True, replica=None):
+        # SQLite no tiene réplicas: 'replica' se ignora y todo va al mismo archivo
         with get_db_connection() as conn:
             cursor = conn.cursor()
             cursor.execute(query, params) if params else cursor.execute(query)
@@ -144,6 +226,95 @@ else:
             return results
 
 
+def replica_para_ruta(endpoint, ultima_escritura=None):
+    """Réplica que usarán todas las lecturas del request (None = primaria).
+
+    Se elige una sola vez por request para que las consultas de un mismo
+    reporte vean el mismo estado de los datos. Si el cliente escribió hace
+    menos de lo que una réplica sana puede estar atrasada, lee de la primaria.
+    """
+    if not REPLICA_URLS or DATABASE_URL is None or endpoint in RUTAS_SOLO_PRIMARIA:
+        return None
+    if ultima_escritura and time.time() - ultima_escritura < REPLICA_MAX_LAG + REPLICA_CHECK_INTERVAL:
+        return None
+    return _elegir_replica()
+
+
+TABLAS_PARTICIONADAS = ('Ventas', 'DetalleVentas', 'MovimientosInventario')
+PARTICIONES_FUTURAS = int(os.getenv('DATABASE_PARTICIONES_FUTURAS', 2))
+# Cada cuántos segundos se vuelven a crear las particiones de los próximos meses
+PARTICIONES_INTERVALO = float(os.getenv('DATABASE_PARTICIONES_INTERVALO', 6 * 3600))
+
+
+def sumar_meses(fecha, meses):
+    """Primer dia del mes desplazado 'meses' desde la fecha dada"""
+    indice = fecha.year * 12 + fecha.month - 1 + meses
+    return date(indice // 12, indice % 12 + 1, 1)
+
+
+def nombre_particion(tabla, inicio):
+    return f"{tabla.lower()}_{inicio.year}_{inicio.month:02d}"
+
+
+def tabla_particionada(cursor, tabla):
+    """True si la tabla es particionada en PostgreSQL (las instalaciones anteriores no lo son)"""
+    cursor.execute("SELECT relkind FROM pg_class WHERE relname = %s", (tabla.lower(),))
+    row = cursor.fetchone()
+    return row is not None and row['relkind'] == 'p'
+
+
+def _asegurar_particiones_pg(cursor):
+    """Crea la particion DEFAULT y las mensuales desde el mes actual hasta PARTICIONES_FUTURAS meses adelante"""
+    hoy = date.today()
+    inicio = sumar_meses(hoy, 0)
+    fin = sumar_meses(hoy, PARTICIONES_FUTURAS)
+    for tabla in TABLAS_PARTICIONADAS:
+        if not tabla_particionada(cursor, tabla):
+            continue
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS {tabla.lower()}_default PARTITION OF {tabla} DEFAULT")
+        mes = inicio
+        while mes <= fin:
+            siguiente = sumar_meses(mes, 1)
+            # Falla si la particion DEFAULT ya tiene filas de ese mes; se deja ahi
+            cursor.execute("SAVEPOINT particion")
+            try:
+                cursor.execute(f"""CREATE TABLE IF NOT EXISTS {nombre_particion(tabla, mes)} PARTITION OF {tabla}
+                    FOR VALUES FROM ('{mes.isoformat()}') TO ('{siguiente.isoformat()}')""")
+                cursor.execute("RELEASE SAVEPOINT particion")
+            except Exception as e:
+                cursor.execute("ROLLBACK TO SAVEPOINT particion")
+                print(f"No se pudo crear la particion {nombre_particion(tabla, mes)}: {e}")
+            mes = siguiente
+
+
+def asegurar_particiones():
+    """Crea las particiones mensuales que falten (PostgreSQL); se llama al iniciar y al archivar"""
+    if DATABASE_URL is None:
+        return
+    with get_db_connection() as conn:
+        _asegurar_particiones_pg(conn.cursor())
+
+
+def iniciar_mantenimiento_particiones():
+    """Hilo que mantiene creadas las particiones futuras mientras el proceso corre.
+
+    Sin él, un proceso que dure más que PARTICIONES_FUTURAS meses manda las
+    filas nuevas a la partición DEFAULT y esos meses ya no se pueden crear.
+    """
+    if DATABASE_URL is None:
+        return
+
+    def ciclo():
+        while True:
+            time.sleep(PARTICIONES_INTERVALO)
+            try:
+                asegurar_particiones()
+            except Exception as e:
+                print(f"Error creando particiones: {e}")
+
+    threading.Thread(target=ciclo, name='mantenimiento-particiones', daemon=True).start()
+
+
 def init_database():
     with get_db_connection() as conn:
         cursor = conn.cursor()
@@ -159,11 +330,13 @@ def init_database():
                 Precio DECIMAL(10,2), Stock INTEGER DEFAULT 0,
                 CategoriaID INTEGER REFERENCES Categorias(CategoriaID),
                 ProveedorID INTEGER REFERENCES Proveedores(ProveedorID), FechaAlta DATE)""")
+            # Tablas que crecen con el tiempo: particionadas por mes sobre Fecha
             cursor.execute("""CREATE TABLE IF NOT EXISTS MovimientosInventario (
-                MovimientoID SERIAL PRIMARY KEY,
+                MovimientoID SERIAL,
                 ProductoID INTEGER REFERENCES Productos(ProductoID),
                 Tipo TEXT CHECK(Tipo IN ('Entrada', 'Salida')),
-                Cantidad INTEGER, Fecha TIMESTAMP DEFAULT CURRENT_TIMESTAMP)""")
+                Cantidad INTEGER, Fecha TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (MovimientoID, Fecha)) PARTITION BY RANGE (Fecha)""")
             cursor.execute("""CREATE TABLE IF NOT EXISTS Usuarios (
                 UsuarioID SERIAL PRIMARY KEY, Nombre VARCHAR(100),
                 CorreoElectronico VARCHAR(100), Contrasena VARCHAR(100))""")
@@ -172,15 +345,26 @@ def init_database():
                 ProductoID INTEGER REFERENCES Productos(ProductoID) ON DELETE CASCADE,
                 FechaAlta DATE)""")
             cursor.execute("""CREATE TABLE IF NOT EXISTS Ventas (
-                VentaID SERIAL PRIMARY KEY, Fecha TIMESTAMP NOT NULL,
+                VentaID SERIAL, Fecha TIMESTAMP NOT NULL,
                 Total DECIMAL(10,2) NOT NULL, Recibido DECIMAL(10,2) NOT NULL,
-                Cambio DECIMAL(10,2) NOT NULL, Descripcion TEXT)""")
+                Cambio DECIMAL(10,2) NOT NULL, Descripcion TEXT,
+                PRIMARY KEY (VentaID, Fecha)) PARTITION BY RANGE (Fecha)""")
             cursor.execute("""CREATE TABLE IF NOT EXISTS DetalleVentas (
-                DetalleID SERIAL PRIMARY KEY,
-                VentaID INTEGER NOT NULL REFERENCES Ventas(VentaID) ON DELETE CASCADE,
+                DetalleID SERIAL, VentaID INTEGER NOT NULL, Fecha TIMESTAMP NOT NULL,
                 ProductoID INTEGER NOT NULL REFERENCES Productos(ProductoID),
                 NombreProducto VARCHAR(100) NOT NULL, Cantidad INTEGER NOT NULL,
-                PrecioUnitario DECIMAL(10,2) NOT NULL, Subtotal DECIMAL(10,2) NOT NULL)""")
+                PrecioUnitario DECIMAL(10,2) NOT NULL, Subtotal DECIMAL(10,2) NOT NULL,
+                PRIMARY KEY (DetalleID, Fecha),
+                FOREIGN KEY (VentaID, Fecha) REFERENCES Ventas(VentaID, Fecha) ON DELETE CASCADE)
+                PARTITION BY RANGE (Fecha)""")
+            # Instalaciones anteriores tienen tablas sin particionar y DetalleVentas sin Fecha
+            cursor.execute("""SELECT COUNT(*) as count FROM information_schema.columns
+                WHERE table_name = 'detalleventas' AND column_name = 'fecha'""")
+            if cursor.fetchone()['count'] == 0:
+                cursor.execute("ALTER TABLE DetalleVentas ADD COLUMN Fecha TIMESTAMP")
+                cursor.execute("""UPDATE DetalleVentas SET Fecha = (
+                    SELECT v.Fecha FROM Ventas v WHERE v.VentaID = DetalleVentas.VentaID)""")
+            _asegurar_particiones_pg(cursor)
         else:
             cursor.execute("""CREATE TABLE IF NOT EXISTS Categorias (
                 CategoriaID INTEGER PRIMARY KEY AUTOINCREMENT, Nombre VARCHAR(50) NOT NULL)""")
@@ -210,9 +394,15 @@ def init_database():
                 DetalleID INTEGER PRIMARY KEY AUTOINCREMENT, VentaID INTEGER NOT NULL,
                 ProductoID INTEGER NOT NULL, NombreProducto VARCHAR(100) NOT NULL,
                 Cantidad INTEGER NOT NULL, PrecioUnitario DECIMAL(10,2) NOT NULL,
-                Subtotal DECIMAL(10,2) NOT NULL,
+                Subtotal DECIMAL(10,2) NOT NULL, Fecha DATETIME,
                 FOREIGN KEY (VentaID) REFERENCES Ventas(VentaID) ON DELETE CASCADE,
                 FOREIGN KEY (ProductoID) REFERENCES Productos(ProductoID))""")
+            # En SQLite los periodos cerrados se mueven a bases de archivo (ver archivo.py)
+            columnas = [row[1] for row in cursor.execute("PRAGMA table_info(DetalleVentas)").fetchall()]
+            if 'Fecha' not in columnas:
+                cursor.execute("ALTER TABLE DetalleVentas ADD COLUMN Fecha DATETIME")
+                cursor.execute("""UPDATE DetalleVentas SET Fecha = (
+                    SELECT v.Fecha FROM Ventas v WHERE v.VentaID = DetalleVentas.VentaID)""")
 
         # Insertar datos de prueba si no existen
         if is_pg:
@@ -247,6 +437,9 @@ def test_connection():
                 cursor.execute("SELECT version()")
                 version = cursor.fetchone()['version']
                 print(f"Conectado a PostgreSQL: {version}")
+                if REPLICA_URLS:
+                    sanas = sum(1 for url in REPLICA_URLS if _replica_sana(url))
+                    print(f"Replicas de lectura disponibles: {sanas}/{len(REPLICA_URLS)}")
             else:
                 cursor.execute("SELECT sqlite_version()")
                 version = cursor.fetchone()[0]
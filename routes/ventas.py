@@ -1,5 +1,8 @@
-from flask import Blueprint, jsonify, request
-from database import execute_query, execute_transaction
+from flask import Blueprint, request
+from database import execute_query, execute_transaction, replica_para_ruta, COOKIE_ULTIMA_ESCRITURA
+from serializacion import respuesta_json
+from archivo import consultar_archivo, periodos_en_rango
+from admision import reporte_controlado, invalidar_reportes
 from datetime import datetime, timedelta
 
 ventas_bp = Blueprint('ventas', __name__)
@@ -11,7 +14,7 @@ def registrar_venta():
         data = request.json
         items = data.get('items', [])
         if not items:
-            return jsonify({'error': 'Debe haber al menos un producto'}), 400
+            return respuesta_json({'error': 'Debe haber al menos un producto'}), 400
 
         total = float(data.get('total', 0))
         recibido = float(data.get('recibido', 0))
@@ -23,12 +26,12 @@ def registrar_venta():
             producto_id = item.get('ProductoID')
             cantidad = item.get('Cantidad', 0)
             if not producto_id or cantidad <= 0:
-                return jsonify({'error': f'Datos invalidos'}), 400
+                return respuesta_json({'error': f'Datos invalidos'}), 400
             producto = execute_query("SELECT Stock, Nombre FROM Productos WHERE ProductoID = ?", (producto_id,))
             if not producto:
-                return jsonify({'error': f'Producto no encontrado'}), 404
+                return respuesta_json({'error': f'Producto no encontrado'}), 404
             if producto[0]['Stock'] < cantidad:
-                return jsonify({'error': f'Stock insuficiente'}), 400
+                return respuesta_json({'error': f'Stock insuficiente'}), 400
 
         venta_id = execute_query(
             "INSERT INTO Ventas (Fecha, Total, Recibido, Cambio, Descripcion) VALUES (?, ?, ?, ?, ?)",
@@ -43,17 +46,20 @@ def registrar_venta():
             precio_unitario = float(item.get('Precio', 0))
             subtotal = precio_unitario * cantidad
             operations.append((
-                "INSERT INTO DetalleVentas (VentaID, ProductoID, NombreProducto, Cantidad, PrecioUnitario, Subtotal) VALUES (?, ?, ?, ?, ?, ?)",
-                (venta_id, producto_id, nombre, cantidad, precio_unitario, subtotal)
+                "INSERT INTO DetalleVentas (VentaID, Fecha, ProductoID, NombreProducto, Cantidad, PrecioUnitario, Subtotal) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (venta_id, fecha, producto_id, nombre, cantidad, precio_unitario, subtotal)
             ))
             operations.append(("UPDATE Productos SET Stock = Stock - ? WHERE ProductoID = ?", (cantidad, producto_id)))
             operations.append(("INSERT INTO MovimientosInventario (ProductoID, Tipo, Cantidad) VALUES (?, 'Salida', ?)", (producto_id, cantidad)))
 
         execute_transaction(operations)
-        return jsonify({'mensaje': 'Venta registrada', 'VentaID': venta_id, 'total': total, 'cambio': cambio}), 201
+        # La venta ya quedo guardada: invalidar_reportes no lanza, asi un
+        # reintento del cliente no la registra dos veces
+        invalidar_reportes(fecha)
+        return respuesta_json({'mensaje': 'Venta registrada', 'VentaID': venta_id, 'total': total, 'cambio': cambio}), 201
     except Exception as e:
         print(f"Error registrar_venta: {e}")
-        return jsonify({'error': str(e)}), 500
+        return respuesta_json({'error': str(e)}), 500
 
 @ventas_bp.route('', methods=['GET'])
 @ventas_bp.route('/', methods=['GET'])
@@ -69,13 +75,47 @@ def obtener_ventas():
             ORDER BY v.Fecha DESC
             LIMIT ?
         """
-        ventas = execute_query(query, (limite,))
-        return jsonify(ventas), 200
+        ventas = execute_query(query, (limite,), replica=replica_para_ruta(request.endpoint, request.cookies.get(COOKIE_ULTIMA_ESCRITURA, type=float)))
+        return respuesta_json(ventas), 200
     except Exception as e:
         print(f"Error obtener_ventas: {e}")
-        return jsonify({'error': str(e)}), 500
+        return respuesta_json({'error': str(e)}), 500
+
+def columna(fila, alias):
+    """Valor de un alias en minúsculas; en PostgreSQL normalize_keys renombra algunos (fecha -> Fecha)"""
+    return fila[alias] if alias in fila else fila[alias.capitalize()]
+
+def combinar_con_archivo(resumen, por_dia, productos):
+    """Suma los parciales de la base principal y de cada mes archivado"""
+    total_ventas = sum(int(r['total_ventas']) for r in resumen)
+    ingresos = sum(float(r['ingresos_totales']) for r in resumen)
+    resumen = [{
+        'total_ventas': total_ventas,
+        'ingresos_totales': ingresos,
+        'promedio_venta': ingresos / total_ventas if total_ventas else 0,
+        'productos_vendidos': sum(int(r['productos_vendidos']) for r in resumen),
+    }]
+
+    dias = {}
+    for dia in por_dia:
+        fecha = str(columna(dia, 'fecha'))
+        acumulado = dias.setdefault(fecha, {'fecha': fecha, 'ventas': 0, 'ingresos': 0})
+        acumulado['ventas'] += int(dia['ventas'])
+        acumulado['ingresos'] += float(dia['ingresos'])
+
+    top = {}
+    for prod in productos:
+        nombre = columna(prod, 'nombre')
+        acumulado = top.setdefault(nombre, {'nombre': nombre, 'cantidad_vendida': 0, 'ingresos': 0})
+        acumulado['cantidad_vendida'] += int(prod['cantidad_vendida'])
+        acumulado['ingresos'] += float(prod['ingresos'])
+
+    return (resumen,
+            [dias[fecha] for fecha in sorted(dias)],
+            sorted(top.values(), key=lambda p: p['cantidad_vendida'], reverse=True)[:10])
 
 @ventas_bp.route('/estadisticas', methods=['GET'])
+@reporte_controlado
 def estadisticas():
     try:
         periodo = request.args.get('periodo', 'mes')
@@ -87,6 +127,10 @@ def estadisticas():
             fecha_inicio = now.replace(day=1).strftime('%Y-%m-%d 00:00:00')
             fecha_fin = now.strftime('%Y-%m-%d 23:59:59')
 
+        rango = (fecha_inicio, fecha_fin)
+        # Meses ya movidos al archivo comprimido que caen dentro del rango
+        archivado = periodos_en_rango(fecha_inicio, fecha_fin)
+
         query_resumen = """
             SELECT 
                 COUNT(v.VentaID) as total_ventas,
@@ -97,7 +141,8 @@ def estadisticas():
             LEFT JOIN DetalleVentas dv ON v.VentaID = dv.VentaID
             WHERE v.Fecha BETWEEN ? AND ?
         """
-        resumen = execute_query(query_resumen, (fecha_inicio, fecha_fin))
+        replica = replica_para_ruta(request.endpoint, request.cookies.get(COOKIE_ULTIMA_ESCRITURA, type=float))
+        resumen = execute_query(query_resumen, rango, replica=replica)
 
         query_por_dia = """
             SELECT 
@@ -109,7 +154,7 @@ def estadisticas():
             GROUP BY DATE(v.Fecha)
             ORDER BY fecha ASC
         """
-        por_dia = execute_query(query_por_dia, (fecha_inicio, fecha_fin))
+        por_dia = execute_query(query_por_dia, rango, replica=replica)
 
         query_productos = """
             SELECT 
@@ -122,32 +167,24 @@ def estadisticas():
             WHERE v.Fecha BETWEEN ? AND ?
             GROUP BY p.ProductoID, p.Nombre
             ORDER BY cantidad_vendida DESC
-            LIMIT 10
         """
-        productos_top = execute_query(query_productos, (fecha_inicio, fecha_fin))
+        if not archivado:
+            query_productos += " LIMIT 10"
+        productos_top = execute_query(query_productos, rango, replica=replica)
+
+        if archivado:
+            resumen, por_dia, productos_top = combinar_con_archivo(
+                resumen + consultar_archivo(query_resumen, rango, fecha_inicio, fecha_fin),
+                por_dia + consultar_archivo(query_por_dia, rango, fecha_inicio, fecha_fin),
+                productos_top + consultar_archivo(query_productos, rango, fecha_inicio, fecha_fin))
 
         estadisticas_data = resumen[0] if resumen else {
             'total_ventas': 0, 'ingresos_totales': 0,
             'promedio_venta': 0, 'productos_vendidos': 0
         }
 
-        # Convertir todos los valores a float para asegurar que sean números
-        estadisticas_data['ingresos_totales'] = float(estadisticas_data.get('ingresos_totales', 0))
-        estadisticas_data['promedio_venta'] = float(estadisticas_data.get('promedio_venta', 0))
-        estadisticas_data['total_ventas'] = int(estadisticas_data.get('total_ventas', 0))
-        estadisticas_data['productos_vendidos'] = int(estadisticas_data.get('productos_vendidos', 0))
-
-        # Convertir por_dia
-        for dia in por_dia:
-            dia['ingresos'] = float(dia.get('ingresos', 0))
-            dia['ventas'] = int(dia.get('ventas', 0))
-
-        # Convertir productos_top
-        for prod in productos_top:
-            prod['cantidad_vendida'] = int(prod.get('cantidad_vendida', 0))
-            prod['ingresos'] = float(prod.get('ingresos', 0))
-
-        return jsonify({
+        # Los tipos (Decimal, fechas) se normalizan en respuesta_json
+        return respuesta_json({
             'estadisticas': estadisticas_data,
             'ventas_diarias': por_dia,
             'productos_top': productos_top
@@ -156,9 +193,10 @@ def estadisticas():
         print(f"Error estadisticas: {e}")
         import traceback
         traceback.print_exc()
-        return jsonify({'error': str(e)}), 500
+        return respuesta_json({'error': str(e)}), 500
 
 @ventas_bp.route('/comparativa', methods=['GET'])
+@reporte_controlado
 def comparativa():
     try:
         tipo = request.args.get('tipo', 'mensual')
@@ -174,14 +212,17 @@ def comparativa():
             ORDER BY fecha DESC
             LIMIT 365
         """
-        datos = execute_query(query)
+        datos = execute_query(query, replica=replica_para_ruta(request.endpoint, request.cookies.get(COOKIE_ULTIMA_ESCRITURA, type=float)))
+        # Completar con los meses archivados del último año
+        desde = (datetime.now() - timedelta(days=365)).strftime('%Y-%m-%d')
+        datos += consultar_archivo(query, None, desde, None)
         
         # Agrupar por mes o semana en Python
         from collections import defaultdict
         agrupado = defaultdict(lambda: {'total_ventas': 0, 'total_monto': 0})
         
         for row in datos:
-            fecha_str = row['fecha']
+            fecha_str = columna(row, 'fecha')
             if isinstance(fecha_str, str):
                 fecha = datetime.strptime(fecha_str.split()[0], '%Y-%m-%d')
             else:
@@ -204,32 +245,34 @@ def comparativa():
                 'total_monto': valores['total_monto']
             })
         
-        return jsonify(resultado), 200
+        return respuesta_json(resultado), 200
     except Exception as e:
         print(f"Error comparativa: {e}")
         import traceback
         traceback.print_exc()
-        return jsonify([]), 200
+        # La gráfica sigue recibiendo una lista, pero este vacío no debe quedar en caché
+        return respuesta_json([]), 200, {'Cache-Control': 'no-store'}
 
 @ventas_bp.route('/<int:id>', methods=['GET'])
 def obtener_venta_detalle(id):
     try:
         venta = execute_query("SELECT VentaID, Fecha, Total, Recibido, Cambio, Descripcion FROM Ventas WHERE VentaID = ?", (id,))
         if not venta:
-            return jsonify({'error': 'Venta no encontrada'}), 404
+            return respuesta_json({'error': 'Venta no encontrada'}), 404
         items = execute_query("SELECT DetalleID, ProductoID, NombreProducto, Cantidad, PrecioUnitario, Subtotal FROM DetalleVentas WHERE VentaID = ?", (id,))
         resultado = venta[0]
         resultado['items'] = items
-        return jsonify(resultado), 200
+        return respuesta_json(resultado), 200
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return respuesta_json({'error': str(e)}), 500
 
 @ventas_bp.route('/<int:id>', methods=['DELETE'])
 def eliminar_venta(id):
     try:
         filas = execute_query("DELETE FROM Ventas WHERE VentaID = ?", (id,), fetch=False)
         if filas == 0:
-            return jsonify({'error': 'Venta no encontrada'}), 404
-        return jsonify({'mensaje': 'Venta eliminada'}), 200
+            return respuesta_json({'error': 'Venta no encontrada'}), 404
+        invalidar_reportes()
+        return respuesta_json({'mensaje': 'Venta eliminada'}), 200
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
\ No newline at end of file
+        return respuesta_json({'error': str(e)}), 500
\ No newline at end of file
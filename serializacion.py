@@ -0,0 +1,107 @@
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from flask import Response
+
+FORMATO_FECHA_HORA = '%Y-%m-%d %H:%M:%S'
+
+
+# El codificador de cada columna se elige por el tipo de su primer valor no nulo,
+# igual que saldria de cursor.description en PostgreSQL (SQLite no declara tipos
+# para expresiones). Los numeros fraccionarios del esquema son dinero (DECIMAL(10,2)
+# y sus sumas o promedios), por eso se redondean a 2 decimales en ambos motores.
+# Los codificadores devuelven el valor tal cual si no tiene el tipo esperado
+# (ej. SQLite guarda texto en una columna DECIMAL si la API lo recibio asi).
+
+def _a_dinero(valor):
+    try:
+        return round(float(valor), 2)
+    except (TypeError, ValueError):
+        return valor
+
+
+def _a_entero(valor):
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        return valor
+
+
+def _a_fecha_hora(valor):
+    return valor.strftime(FORMATO_FECHA_HORA) if isinstance(valor, datetime) else preparar(valor)
+
+
+def _a_fecha(valor):
+    return valor.isoformat() if isinstance(valor, date) else preparar(valor)
+
+
+def _resolver_codificador(valor):
+    """Codificador para una columna segun el tipo de su primer valor no nulo"""
+    if isinstance(valor, Decimal):
+        # La escala es fija por columna: SUM/COUNT sobre enteros llegan como
+        # Decimal sin decimales en PostgreSQL
+        exponente = valor.as_tuple().exponent
+        return _a_entero if isinstance(exponente, int) and exponente >= 0 else _a_dinero
+    if isinstance(valor, float):
+        return _a_dinero
+    if isinstance(valor, datetime):
+        return _a_fecha_hora
+    if isinstance(valor, date):
+        return _a_fecha
+    if isinstance(valor, (list, dict)):
+        return preparar
+    return None
+
+
+def _preparar_filas(filas):
+    """Codifica un conjunto de resultados modificando las filas en el lugar.
+
+    Los codificadores se resuelven una vez por columna y solo se recorren las
+    columnas que necesitan conversion; si ninguna la necesita (lo habitual en
+    SQLite) las filas se devuelven sin tocarlas.
+    """
+    if not filas or not isinstance(filas[0], dict):
+        return [preparar(fila) for fila in filas]
+    pendientes = set(filas[0])
+    codificadores = []
+    for fila in filas:
+        if not pendientes:
+            break
+        for columna in [c for c in pendientes if fila.get(c) is not None]:
+            pendientes.discard(columna)
+            codificador = _resolver_codificador(fila[columna])
+            if codificador:
+                codificadores.append((columna, codificador))
+    if not codificadores:
+        return filas
+    for fila in filas:
+        for columna, codificador in codificadores:
+            valor = fila.get(columna)
+            if valor is not None:
+                fila[columna] = codificador(valor)
+    return filas
+
+
+def preparar(datos):
+    """Convierte resultados de consulta (filas, dicts anidados o escalares) a tipos nativos de JSON"""
+    if isinstance(datos, list):
+        return _preparar_filas(datos)
+    if isinstance(datos, dict):
+        return _preparar_filas([datos])[0]
+    if isinstance(datos, datetime):
+        return _a_fecha_hora(datos)
+    if isinstance(datos, date):
+        return _a_fecha(datos)
+    if isinstance(datos, Decimal):
+        return _resolver_codificador(datos)(datos)
+    return datos
+
+
+def respuesta_json(datos):
+    """Respuesta JSON con formato uniforme para SQLite y PostgreSQL.
+
+    Tras preparar() todos los valores ya son nativos, asi que se codifica sin
+    hook de tipos ni verificacion de ciclos.
+    """
+    cuerpo = json.dumps(preparar(datos), ensure_ascii=False, separators=(',', ':'), check_circular=False)
+    return Response(cuerpo, mimetype='application/json')